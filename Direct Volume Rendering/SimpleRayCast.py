@@ -4,12 +4,15 @@
 
 # noinspection PyUnresolvedReferences
 from vtkmodules.vtkInteractionStyle import vtkInteractorStyleTrackballCamera
-from vtkmodules.vtkCommonCore import vtkCommand
+from vtkmodules.vtkCommonCore import (
+    VTK_DOUBLE,
+    VTK_FLOAT,
+    VTK_UNSIGNED_CHAR,
+    vtkCommand
+)
 from vtkmodules.vtkCommonColor import vtkNamedColors
 from vtkmodules.vtkCommonDataModel import vtkPiecewiseFunction
-from vtkmodules.vtkIOImage import vtkMetaImageReader
-from vtkmodules.vtkIOLegacy import vtkStructuredPointsReader
-from vtkmodules.vtkIOXML import vtkXMLImageDataReader
+from vtkmodules.vtkImagingCore import vtkImageShiftScale
 from vtkmodules.vtkRenderingCore import (
     vtkColorTransferFunction,
     vtkRenderWindow,
@@ -18,12 +21,35 @@ from vtkmodules.vtkRenderingCore import (
     vtkVolume,
     vtkVolumeProperty
 )
-from vtkmodules.vtkRenderingVolume import vtkFixedPointVolumeRayCastMapper
+from vtkmodules.vtkRenderingVolume import (
+    vtkFixedPointVolumeRayCastMapper,
+    vtkGPUVolumeRayCastMapper
+)
 # noinspection PyUnresolvedReferences
 from vtkmodules.vtkRenderingVolumeOpenGL2 import vtkOpenGLRayCastImageDisplayHelper
 
+import functools
+import importlib
+import os
 from timeit import default_timer as timer
 
+# Reader for each supported file extension as (module, class). The module is
+# only imported when a file of that type is read, so unused IO libraries are
+# never loaded.
+READERS = {
+    '.mhd': ('vtkmodules.vtkIOImage', 'vtkMetaImageReader'),
+    '.vti': ('vtkmodules.vtkIOXML', 'vtkXMLImageDataReader'),
+    '.vtk': ('vtkmodules.vtkIOLegacy', 'vtkStructuredPointsReader'),
+}
+
+# Control points (scalar, r, g, b) of the available color transfer functions.
+COLOR_TRANSFER_FUNCTIONS = [
+    [(0, 0.0, 0.667, 0.0),
+     (96, 0.925, 0.463, 0.0),
+     (130, 0.667, 0.463, 0.0),
+     (255, 0.376, 0.188, 0.0)],
+]
+
 class FpsObserver:
     '''Counts the number of frames rendered by the given renderer
     and writes the resulting fps to the terminal once a second.'''
@@ -36,18 +62,59 @@ class FpsObserver:
         self.mFpsUpdateRate = 1         # How often to update FPS in seconds.
         
     def __call__(self, caller, event):
-        if event == "EndEvent":
-            self.mFrameCount = self.mFrameCount + 1
+        # Only registered for EndEvent, so every call is a rendered frame.
+        # The clock is read once per frame and the fps printed once a second.
+        self.mFrameCount = self.mFrameCount + 1
+        
+        _currentTime = timer()
+        _duration    = _currentTime - self.mStartTime
+        if _duration > self.mFpsUpdateRate:
+            _fps = self.mFrameCount/_duration
+            print("fps={:.3f}".format(_fps))
             
-            if timer() - self.mStartTime > self.mFpsUpdateRate:
-                _currentTime     = timer()
-                _duration        = _currentTime - self.mStartTime
-                
-                _fps = self.mFrameCount/_duration
-                print("fps={:.3f}".format(_fps))
-                
-                self.mStartTime  = _currentTime
-                self.mFrameCount = 0
+            self.mStartTime  = _currentTime
+            self.mFrameCount = 0
+
+class InteractionObserver:
+    '''Renders the volume with a coarser image sample distance and without
+    shading while the user drags the view and restores full quality on
+    release. The interactor style fires the interaction events, so it is
+    observed instead of the interactor. Quality is only lowered once a
+    frame is rendered from a moved camera, so a click without dragging
+    keeps the still frame settings untouched.'''
+    def __init__(self, style, renderer, volumeMapper, volumeProperty, interactiveImageSampleDistance=2.0):
+        self.mRenderer = renderer
+        self.mVolumeMapper = volumeMapper
+        self.mVolumeProperty = volumeProperty
+        self.mInteractiveImageSampleDistance = interactiveImageSampleDistance
+        self.mStillImageSampleDistance = volumeMapper.GetMinimumImageSampleDistance()
+        self.mStillShade = volumeProperty.GetShade()
+        self.mInteracting = False   # Between Start- and EndInteractionEvent.
+        self.mLowered = False       # Quality currently lowered.
+        self.mCameraMTime = 0       # Camera modified time at interaction start.
+        style.AddObserver(vtkCommand.StartInteractionEvent, self)
+        style.AddObserver(vtkCommand.EndInteractionEvent, self)
+        renderer.AddObserver(vtkCommand.StartEvent, self)
+        
+    def __call__(self, caller, event):
+        # The mapper auto adjusts its image sample distance, so the minimum
+        # it may choose is raised instead of setting the distance directly.
+        # Shading roughly doubles the cost of every sample.
+        if event == "StartInteractionEvent":
+            self.mInteracting = True
+            self.mCameraMTime = self.mRenderer.GetActiveCamera().GetMTime()
+        elif event == "StartEvent":
+            if (self.mInteracting and not self.mLowered
+                    and self.mRenderer.GetActiveCamera().GetMTime() != self.mCameraMTime):
+                self.mLowered = True
+                self.mVolumeMapper.SetMinimumImageSampleDistance(self.mInteractiveImageSampleDistance)
+                self.mVolumeProperty.ShadeOff()
+        elif event == "EndInteractionEvent":
+            self.mInteracting = False
+            if self.mLowered:
+                self.mLowered = False
+                self.mVolumeMapper.SetMinimumImageSampleDistance(self.mStillImageSampleDistance)
+                self.mVolumeProperty.SetShade(self.mStillShade)
 
 class MyInteractorStyle(vtkInteractorStyleTrackballCamera):
     '''Custom interactor that adjusts the given volumeProperty when user
@@ -64,43 +131,108 @@ class MyInteractorStyle(vtkInteractorStyleTrackballCamera):
         self.mTFList = TFList
         self.mIndex = 0
         self.mNearest = False
+        self.mRenderedState = self.GetRenderState()
+
+    def GetRenderState(self):
+        '''The color and opacity transfer functions and interpolation that
+        are currently set on the volume property.'''
+        colorTF, opacityTF = self.mTFList[self.mIndex]
+        return (id(colorTF), id(opacityTF), self.mNearest)
+
+    def RenderIfChanged(self):
+        '''Render a new frame only if the state differs from the last
+        rendered one, as every frame is a full ray cast of the volume.'''
+        state = self.GetRenderState()
+        if state == self.mRenderedState:
+            return
+        self.mRenderedState = state
+        self.mRenWin.Render()
         
     def OnChar(self, obj, event):
         key = obj.GetInteractor().GetKeySym()
         if key == 't' or key == 'T':
+            # The functions are built once up front. The property only marks
+            # itself modified for a different function object, so the shared
+            # color transfer function is not rebuilt by the mapper.
             self.mIndex = (self.mIndex+1) % len(self.mTFList)
             print("Switching to transfer function #" + str(self.mIndex))
             self.mVolumeProperty.SetColor(self.mTFList[self.mIndex][0])
             self.mVolumeProperty.SetScalarOpacity(self.mTFList[self.mIndex][1])
+            self.RenderIfChanged()
         elif key == 'i' or key == 'I':
             self.mNearest = not self.mNearest
             interpolation_type = "Nearest Neighbor" if self.mNearest else "Trilinear"
             print("Interpolation Type: " + interpolation_type)
             self.mVolumeProperty.SetInterpolationType(0 if self.mNearest else 1)
-        self.mRenWin.Render()
+            self.RenderIfChanged()
         super(MyInteractorStyle, self).OnChar()
 
 
+@functools.lru_cache(maxsize=None)
+def GetColorTransferFunction(tfId, scalarRange):
+    '''Returns color transfer function number tfId over scalarRange. The
+    control points keep their scalar values, AdjustRange only drops those
+    outside scalarRange and adds points at its ends. Cached, so that every
+    dataset with the same scalar range shares one function object instead
+    of building its own.'''
+    colorTransferFunction = vtkColorTransferFunction()
+    for point in COLOR_TRANSFER_FUNCTIONS[tfId]:
+        colorTransferFunction.AddRGBPoint(*point)
+    colorTransferFunction.AdjustRange(scalarRange)
+    return colorTransferFunction
+
+def CreateVolumeMapper(renWin, volumeProperty):
+    '''Create a GPU ray cast mapper if the render window supports it and
+    fall back to the CPU fixed point ray cast mapper otherwise.'''
+    volumeMapper = vtkGPUVolumeRayCastMapper()
+    if volumeMapper.IsRenderSupported(renWin, volumeProperty):
+        # Jittering the ray start positions hides wood-grain artifacts.
+        volumeMapper.SetUseJittering(1)
+    else:
+        volumeMapper = vtkFixedPointVolumeRayCastMapper()
+    return volumeMapper
+
 def ReadInputFile(InputFilename):
     '''Read input, selecting reader class based on file extension'''
-    reader=None
-    if InputFilename.endswith('.mhd'):
-        reader=vtkMetaImageReader()
-    if InputFilename.endswith('.vti'):
-        reader=vtkXMLImageDataReader()
-    if InputFilename.endswith('.vtk'):
-        reader=vtkStructuredPointsReader()
-    if reader:
-        reader.SetFileName(InputFilename)
-        reader.Update()
+    ext = os.path.splitext(InputFilename)[1].lower()
+    if ext not in READERS:
+        raise ValueError("Unsupported file extension '{}': {}".format(ext, InputFilename))
+    module, className = READERS[ext]
+    reader = getattr(importlib.import_module(module), className)()
+    reader.SetFileName(InputFilename)
+    reader.Update()
     return reader
 
+def QuantizeToUnsignedChar(reader):
+    '''Returns a filter that converts the reader's volume to unsigned char,
+    the range the transfer functions are defined on, so the GPU mapper
+    uploads a smaller 3D texture. Integer volumes whose range already fits
+    are only cast, all others (including every floating point volume) are
+    rescaled to [0,255]; constant ones are clamped. Unsigned char input is
+    returned unchanged.'''
+    data = reader.GetOutput()
+    if data.GetScalarType() == VTK_UNSIGNED_CHAR:
+        return reader
+    isInteger = data.GetScalarType() not in (VTK_FLOAT, VTK_DOUBLE)
+    scalarMin, scalarMax = data.GetScalarRange()
+    shifter = vtkImageShiftScale()
+    shifter.SetInputConnection(reader.GetOutputPort())
+    shifter.SetOutputScalarTypeToUnsignedChar()
+    shifter.ClampOverflowOn()
+    fits = isInteger and scalarMin >= 0 and scalarMax <= 255
+    if not fits and scalarMax > scalarMin:
+        shifter.SetShift(-scalarMin)
+        shifter.SetScale(255.0 / (scalarMax - scalarMin))
+    shifter.Update()
+    return shifter
+
 def main():
     fileName = get_program_parameters()
     colors = vtkNamedColors()
 
-    # This framework is based on VTK's simple volume rendering example that
-    # uses a vtkFixedPointVolumeRayCastMapper
+    # This framework is based on VTK's simple volume rendering example. The
+    # ray casting runs on the GPU when available and falls back to the
+    # vtkFixedPointVolumeRayCastMapper otherwise.
 
     # Create a renderer, render window, and interactor.
     ren1 = vtkRenderer()
@@ -113,13 +245,29 @@ def main():
     
     # Create the reader for the data.
     reader = ReadInputFile(fileName)
+
+    # The property describes how the data will look.
+    volumeProperty = vtkVolumeProperty()
+
+    # The mapper / ray cast function know how to render the data. Only the
+    # GPU mapper uploads the volume as a texture, so only it is given the
+    # smaller unsigned char copy; the CPU mapper keeps full precision.
+    volumeMapper = CreateVolumeMapper(renWin, volumeProperty)
+    volumeSource = reader
+    if isinstance(volumeMapper, vtkGPUVolumeRayCastMapper):
+        volumeSource = QuantizeToUnsignedChar(reader)
+    volumeMapper.SetInputConnection(volumeSource.GetOutputPort())
+    volumeMapper.SetAutoAdjustSampleDistances(1)
+    if isinstance(volumeMapper, vtkFixedPointVolumeRayCastMapper):
+        # Step length along the rays for still frames and while interacting,
+        # in world units. The GPU mapper derives its step length from the
+        # spacing itself while auto adjusting, so it is left alone.
+        spacing = volumeSource.GetOutput().GetSpacing()
+        volumeMapper.SetSampleDistance(0.5 * min(spacing))
+        volumeMapper.SetInteractiveSampleDistance(2.0 * max(spacing))
     
     # Create transfer mapping scalar value to color.
-    colorTransferFunction = vtkColorTransferFunction()
-    colorTransferFunction.AddRGBPoint(0, 0.0, 0.667, 0.0)
-    colorTransferFunction.AddRGBPoint(96, 0.925, 0.463, 0.0)
-    colorTransferFunction.AddRGBPoint(130, 0.667, 0.463, 0.0)
-    colorTransferFunction.AddRGBPoint(255, 0.376, 0.188, 0.0)
+    colorTransferFunction = GetColorTransferFunction(0, volumeSource.GetOutput().GetScalarRange())
 
 
     # Create transfer mapping scalar value to opacity.
@@ -143,18 +291,12 @@ def main():
     TFList.append((colorTransferFunction,opacityTransferFunction))
     TFList.append((colorTransferFunction, newOpacityTransferFunction))
     
-    # The property describes how the data will look.
-    volumeProperty = vtkVolumeProperty()
+    # Set up the look of the volume.
     volumeProperty.SetColor(colorTransferFunction)
     volumeProperty.SetScalarOpacity(opacityTransferFunction)
     volumeProperty.ShadeOn()
     volumeProperty.SetInterpolationTypeToLinear()
 
-    # The mapper / ray cast function know how to render the data.
-    volumeMapper = vtkFixedPointVolumeRayCastMapper()
-    volumeMapper.SetInputConnection(reader.GetOutputPort())
-    volumeMapper.SetAutoAdjustSampleDistances(1)
-
     # The volume holds the mapper and the property and
     # can be used to position/orient the volume.
     volume = vtkVolume()
@@ -171,6 +313,7 @@ def main():
 
     # The custom interactor style.
     style = MyInteractorStyle(renWin,volumeProperty,TFList)
+    interactionObserver = InteractionObserver(style, ren1, volumeMapper, volumeProperty)
 
     print("Press 't' to toggle transfer function.")
     print("Press 'i' toggle between trilinear and nearest neighbor interpolation.")
@@ -186,7 +329,8 @@ def get_program_parameters():
     import argparse
     description = 'Basic Volume Rendering Demo.'
     epilogue = '''
-     This is a simple volume rendering example that uses a vtkFixedPointVolumeRayCastMapper.
+     This is a simple volume rendering example that uses a vtkGPUVolumeRayCastMapper,
+     falling back to a vtkFixedPointVolumeRayCastMapper without GPU support.
     '''
     parser = argparse.ArgumentParser(description=description, epilog=epilogue)
     parser.add_argument('--filename', help='bonsai.vti')
@@ -1,8 +1,14 @@
+import heapq
 from collections import namedtuple
 from pprint import pformat
 import numpy as np
 
-class Node(namedtuple("Node", "location left_child right_child")):
+class KDTree(namedtuple("KDTree", "locations left right axis root")):
+    """ A KDTree stored as flat arrays, one entry per node: node i is located
+    at locations[i], splits along axis[i] and has the children left[i] and
+    right[i], where -1 denotes a missing child. root is the index of the root
+    node, or -1 for an empty tree.
+    """
     def __repr__(self):
         return pformat(self._asdict())
 
@@ -11,31 +17,52 @@ def kdtree(points, axis = 0):
      - a 2D numpy array points, where each column denotes a dimension and each
        row a datapoint
      - an integer axis indicating the dimension to split at the top level
-    this recursive function creates and returns a KDTree as it was discussed
-    in the lecture.
+    this function creates and returns a KDTree as it was discussed
+    in the lecture. The median of each level is selected with np.argpartition,
+    which only guarantees that smaller points end up left of it and larger
+    ones right of it, so construction takes O(n log n) instead of O(n log^2 n).
     """
-    if points.shape[0] == 0:
-        return None
+    n, k = points.shape  # assumes all points have the same dimension
+
+    locations = np.empty((n, k), dtype=points.dtype)
+    left = np.full(n, -1, dtype=np.int32)
+    right = np.full(n, -1, dtype=np.int32)
+    axes = np.empty(n, dtype=np.int8)
+
+    # Every point becomes exactly one node. The stack holds the row indices
+    # of a subtree still to be built, its split axis and where to link it.
+    count = 0
+    stack = [(np.arange(n), axis, left, -1)] if n > 0 else []
+    while stack:
+        idx, axis, children, parent = stack.pop()
 
-    k = points.shape[1]  # assumes all points have the same dimension
+        # Partially sort the indices by axis so that the median lands in the
+        # middle, smaller values before it and larger ones after it.
+        median = idx.shape[0] // 2
+        idx = idx[np.argpartition(points[idx, axis], median)]
 
-    # Sort point list by axis and choose median as pivot element
-    points = points[points[:, axis].argsort()] 
-    median = points.shape[0] // 2
+        # Create node and link it to its parent
+        node = count
+        count += 1
+        locations[node] = points[idx[median]]
+        axes[node] = axis
+        if parent >= 0:
+            children[parent] = node
 
-    # Create node and construct subtrees
-    return Node(
-        location=points[median],
-        left_child=kdtree(points[:median], (axis+1)%k),
-        right_child=kdtree(points[median + 1 :], (axis+1)%k)
-    )
+        # Construct subtrees
+        if median > 0:
+            stack.append((idx[:median], (axis+1)%k, left, node))
+        if median + 1 < idx.shape[0]:
+            stack.append((idx[median + 1 :], (axis+1)%k, right, node))
 
+    return KDTree(locations, left, right, axes, 0 if n > 0 else -1)
 
-def one_NN_rec(tree, axis, query, neighbor):
+
+def one_NN_rec(tree, node, query, neighbor):
     """
     This recursive function accepts
      - a KDTree tree
-     - the axis along which the root node of tree splits
+     - the index of the node in tree to start the search at
      - a query point query
      - the current nearest neighbor
 
@@ -43,27 +70,77 @@ def one_NN_rec(tree, axis, query, neighbor):
     to the query point and the location of the neighbor. For example the
     data points np.array([(1, 3), (1, 8), (2, 2), (2, 10), (3, 6), (4, 1), (5,
     4), (6, 8), (7, 4), (7, 7), (8, 2), (8, 5), (9, 9)]) should return for a
-    query point [4,8] the result (2.0, array([6, 8])). 
+    query point [4,8] the result (2.0, array([6, 8])). Start the search with
+    one_NN_rec(tree, tree.root, query, (np.inf, None)).
     """
+    if node < 0:
+        return neighbor
+
+    point = tree.locations[node]
+    axis = tree.axis[node]
+    dist = np.linalg.norm(query - point)
+    if dist < neighbor[0]:
+        neighbor = (dist, point)
+
+    # Descend into the side of the splitting plane that contains the query
+    diff = query[axis] - point[axis]
+    if diff < 0:
+        near, far = tree.left[node], tree.right[node]
+    else:
+        near, far = tree.right[node], tree.left[node]
+    neighbor = one_NN_rec(tree, near, query, neighbor)
 
-    return
+    # The other side can only contain a closer point if the splitting plane
+    # is nearer than the current neighbor
+    if abs(diff) < neighbor[0]:
+        neighbor = one_NN_rec(tree, far, query, neighbor)
 
+    return neighbor
 
-def kNN_rec(tree, axis, query, neighbors, n_neighbors):
+
+def kNN_rec(tree, node, query, heap, n_neighbors):
     """
     This recursive function accepts
      - a KDTree tree
-     - the axis along which the root node of tree splits
+     - the index of the node in tree to start the search at
      - a query point query
-     - a current list of neighbors, sorted with ascending distance
-       (list of pairs each containing the distance and the point itself)
+     - a heap of the current neighbors, a list of pairs each containing the
+       negated distance and the point as a tuple, so that heapq keeps the
+       farthest neighbor at heap[0]
      - the desired number of neighbors n_neighbors
-    and modifies the neighbors list so that
+    and modifies the heap so that
      - points from the tree are added while we have fewer than n_neighbors
      - all closer points from the tree replace existing neighbors once we
        reached n_neighbors
     It returns the number of nodes that were visited during traversal and modifies
-    the neighbors-object in-place.
+    the heap in-place. The neighbors with ascending distance are obtained by
+    [(-d, p) for d, p in sorted(heap, reverse=True)].
     """
+    if node < 0 or n_neighbors <= 0:
+        return 0
+
+    point = tree.locations[node]
+    axis = tree.axis[node]
+    dist = np.linalg.norm(query - point)
+
+    # Insert or replace in O(log n_neighbors) instead of a linear scan
+    if len(heap) < n_neighbors:
+        heapq.heappush(heap, (-dist, tuple(point)))
+    else:
+        heapq.heappushpop(heap, (-dist, tuple(point)))
+
+    # Descend into the side of the splitting plane that contains the query
+    diff = query[axis] - point[axis]
+    if diff < 0:
+        near, far = tree.left[node], tree.right[node]
+    else:
+        near, far = tree.right[node], tree.left[node]
+    visited = 1 + kNN_rec(tree, near, query, heap, n_neighbors)
+
+    # The other side can only contain closer points if the splitting plane
+    # is nearer than the current farthest neighbor
+    radius = -heap[0][0] if len(heap) == n_neighbors else np.inf
+    if abs(diff) < radius:
+        visited += kNN_rec(tree, far, query, heap, n_neighbors)
 
-    return
+    return visited
@@ -5,9 +5,9 @@
 import sys
 import getopt
 import math
-from vtkmodules.vtkIOImage import vtkMetaImageReader
-from vtkmodules.vtkIOXML import vtkXMLImageDataReader
+import importlib
 from vtkmodules.vtkRenderingVolume import vtkFixedPointVolumeRayCastMapper
+from vtkmodules.vtkRenderingVolume import vtkGPUVolumeRayCastMapper
 from vtkmodules.vtkCommonDataModel import vtkPiecewiseFunction
 from vtkmodules.vtkRenderingCore import vtkColorTransferFunction
 from vtkmodules.vtkRenderingCore import vtkVolumeProperty
@@ -20,28 +20,47 @@ from vtkmodules.vtkRenderingCore import vtkRenderer
 from vtkmodules.vtkRenderingCore import vtkRenderWindow
 from vtkmodules.vtkRenderingCore import vtkRenderWindowInteractor
 from vtkmodules.vtkInteractionStyle import vtkInteractorStyleTrackballCamera
-from vtkmodules.vtkCommonCore import vtkInformation
-from vtkmodules.vtkCommonDataModel import vtkImageData
+from vtkmodules.vtkImagingCore import vtkImageCast
+from vtkmodules.vtkImagingGeneral import vtkImageGradientMagnitude
 from vtkmodules.util import numpy_support
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.colors import LogNorm
-from pylab import *
 import os.path
 
 
+# reader for each supported file extension as (module, class), the module
+# is only imported once a file of that type is read
+READERS = {
+    '.mhd': ('vtkmodules.vtkIOImage', 'vtkMetaImageReader'),
+    '.vti': ('vtkmodules.vtkIOXML', 'vtkXMLImageDataReader'),
+}
+
 def ReadInputFile(InputFilename):
-    reader=None
-    if InputFilename.endswith('.mhd'):
-        reader=vtkMetaImageReader()
-    if InputFilename.endswith('.vti'):
-        reader=vtkXMLImageDataReader()
+    ext=os.path.splitext(InputFilename)[1].lower()
+    if ext not in READERS:
+        raise ValueError("Unsupported file extension '{}': {}".format(ext, InputFilename))
+    module,className=READERS[ext]
+    reader=getattr(importlib.import_module(module),className)()
         
     reader.SetFileName(InputFilename)
     reader.Update()
     return reader.GetOutput();
 
+def createVolumeMapper(window, volumeProperty):
+    # use the GPU ray cast mapper if the window supports it and fall back
+    # to the CPU fixed point ray cast mapper otherwise
+    volumeMapper = vtkGPUVolumeRayCastMapper()
+    if volumeMapper.IsRenderSupported(window, volumeProperty):
+        volumeMapper.SetUseJittering(1)
+    else:
+        volumeMapper = vtkFixedPointVolumeRayCastMapper()
+    return volumeMapper
+
 def visualizeHistogram(data,gradMagnitude, bins):
+    # matplotlib is only needed here, importing it lazily keeps it out of
+    # the startup of the volume rendering
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+
     #get the arrays from the data
     x_vtkArray=data.GetPointData().GetScalars()
     y_vtkArray=gradMagnitude.GetPointData().GetScalars()
@@ -51,15 +70,22 @@ def visualizeHistogram(data,gradMagnitude, bins):
     y= numpy_support.vtk_to_numpy(y_vtkArray)
     
     # Visualize the 2D histogram based on the number of bins
-    #<Insert Code >
-
-    #hint : matplotlib provides visualization techniques
-    
-    #</Insert Code>
-
-def volumeVisualization(imageData):
-    volumeMapper = vtkFixedPointVolumeRayCastMapper()
+    # np.histogram2d bins all voxels in one pass of compiled code
+    H,xedges,yedges=np.histogram2d(x,y,bins=bins)
+    plt.imshow(H.T,origin='lower',norm=LogNorm(),aspect='auto',
+               extent=[xedges[0],xedges[-1],yedges[0],yedges[-1]])
+    plt.colorbar(label='voxel count')
+    plt.xlabel('scalar value')
+    plt.ylabel('gradient magnitude')
+    plt.show()
+
+def volumeVisualization(imageData, airFraction=0.1):
+    window=vtkRenderWindow()
+    volumeProperty = vtkVolumeProperty()
+    volumeMapper = createVolumeMapper(window, volumeProperty)
     volumeMapper.SetInputData(imageData)
+    volumeMapper.SetBlendModeToComposite()
+    volumeMapper.SetAutoAdjustSampleDistances(1)
     
 # -----------------------------------------------------------------
 #  Defining a Cropping Plane 
@@ -97,7 +123,11 @@ def volumeVisualization(imageData):
 
     #default <MODIFY>
     # hint : you can add as many points are necessary
+    # keep the lowest airFraction of the range (air/background) fully
+    # transparent, so the ray caster can leap over these empty regions
+    airThreshold=minmax[0]+airFraction*(minmax[1]-minmax[0])
     volumeScalarOpacity.AddPoint(minmax[0],    0.00)
+    volumeScalarOpacity.AddPoint(airThreshold, 0.00)
     volumeScalarOpacity.AddPoint(minmax[1],    1.00)
 
     #default <MODIFY>
@@ -122,8 +152,7 @@ def volumeVisualization(imageData):
 #--------------------------------------------------------
 # Rendering Pipeline 
 #--------------------------------------------------------
-    #create volume property 
-    volumeProperty = vtkVolumeProperty()
+    #fill the volume property 
     volumeProperty.SetScalarOpacity(volumeScalarOpacity)
     volumeProperty.SetGradientOpacity(volumeGradientOpacity)
     volumeProperty.SetColor(color)
@@ -147,7 +176,6 @@ def volumeVisualization(imageData):
     render=vtkRenderer()
     render.AddVolume(volume)
     render.AddActor(outlineActor)
-    window=vtkRenderWindow()
     window.AddRenderer(render)
 
     interactor = vtkRenderWindowInteractor()
@@ -159,39 +187,21 @@ def volumeVisualization(imageData):
 def computeGradientMagnitude(data):
     print ("Computing Gradient Magnitude...")
     
-    #<Insert Code>
-    #compute the gradientfield 
-    
-    #Hint : vtk provides a Sobel Filter 
-    
-    #</Insert Code>
-    
-    # create a vtkImage Data so we can return the gradient magnitude as vtkImageData
-    sizeX=data.GetDimensions()[0];
-    sizeY=data.GetDimensions()[1];
-    sizeZ=data.GetDimensions()[2];
-    
-    tmpInfo=vtkInformation()
-    image=vtkImageData()
-    image.SetDimensions(data.GetDimensions())
-    image.SetExtent(data.GetExtent())
-    image.SetSpacing(data.GetSpacing())            
-    image.SetOrigin(data.GetOrigin())    
-    image.SetNumberOfScalarComponents(1,tmpInfo)
-    image.AllocateScalars(tmpInfo)
-    
-    #iterate over each voxel and compute the gradient magnitude
-    for z in range(0,sizeZ):
-        for y in range(0,sizeY):
-            for x in range(0,sizeX):
-                magnitude=0;
-                #<Insert Code>
-                #compute the gradient magnitude 
-
-                #Hint get the gradient vector and at each voxel and compute its length 
-                
-                #</Insert Code>
-                gradMagnitude.SetScalarComponentFromDouble(x,y,z,0,magnitude)
+    #compute the gradient magnitude with vtk's multithreaded central
+    #differences filter, a single pass over the volume in native memory.
+    #the derivatives and the magnitude are fused per voxel, so no temporary
+    #gradient volumes are allocated. the filter writes the input's scalar
+    #type, so the input is cast to float first and the result is a compact
+    #float32 volume instead of truncated (and wrapped) integer magnitudes
+    castFilter=vtkImageCast()
+    castFilter.SetOutputScalarTypeToFloat()
+    castFilter.SetInputData(data)
+    gradientFilter=vtkImageGradientMagnitude()
+    gradientFilter.SetDimensionality(3)
+    gradientFilter.HandleBoundariesOn()
+    gradientFilter.SetInputConnection(castFilter.GetOutputPort())
+    gradientFilter.Update()
+    gradMagnitude=gradientFilter.GetOutput()
     print ("...Done")
     return gradMagnitude
 
@@ -3,39 +3,58 @@
 # ################################################################
 from vtkmodules.vtkIOXML import vtkXMLImageDataReader
 import vtkmodules.vtkRenderingOpenGL2
+import vtkmodules.vtkRenderingVolumeOpenGL2
 
 from vtkmodules.vtkFiltersModeling import vtkOutlineFilter
-from vtkmodules.vtkCommonDataModel import vtkPlane, vtkPlaneCollection
+from vtkmodules.vtkCommonDataModel import (
+    vtkPiecewiseFunction,
+    vtkPlane,
+    vtkPlaneCollection
+)
 from vtkmodules.vtkFiltersCore import (
     vtkContourFilter
 )
 from vtkmodules.vtkInteractionStyle import vtkInteractorStyleTrackballCamera
 from vtkmodules.vtkRenderingCore import (
     vtkActor,
+    vtkColorTransferFunction,
     vtkPolyDataMapper,
     vtkRenderWindow,
     vtkRenderWindowInteractor,
     vtkProperty,
     vtkRenderer,
+    vtkVolume,
+    vtkVolumeProperty,
 )
+from vtkmodules.vtkRenderingVolume import vtkGPUVolumeRayCastMapper
 
 import sys
 import getopt
 
+# default iso-values as fractions of the scalar range, 67/255 is the skin
+# contour of the ParaView state for head.vti
+SKIN_FRACTION = 67/255
+BONE_FRACTION = 0.5
+
+# color and opacity of the iso-surfaces
+SKIN_COLOR, SKIN_OPACITY = (1.0, 0.49, 0.25), 0.3
+BONE_COLOR, BONE_OPACITY = (1.0, 1.0, 0.9), 1.0
+
 def ReadInputFile(InputFilename):
     reader = vtkXMLImageDataReader()
     reader.SetFileName(InputFilename)
     reader.Update()
     return reader.GetOutput()
 
-def CreateVisualizationFromListOfActors(ListOfActors):
+def CreateVisualizationFromListOfActors(ListOfActors, window=None):
     #create a renderer
     render = vtkRenderer()
-    #Add the Actors to Renderer
+    #Add the Actors (and volumes) to Renderer
     for i in range(0,len(ListOfActors)):
-        render.AddActor(ListOfActors[i]);
+        render.AddViewProp(ListOfActors[i]);
     #Create Render Window
-    window = vtkRenderWindow()
+    if window is None:
+        window = vtkRenderWindow()
     window.AddRenderer(render)
     #Create Interactor
     interactor = vtkRenderWindowInteractor()
@@ -58,38 +77,80 @@ def task1(InputData):
     #return the actor
     return outActor
   
-def task2(InputData):
+def CreateContourActor(InputData, isoValue, color, opacity):
+    #extract the iso-surface as polygons using contourFilter
+    contourFilter = vtkContourFilter()
+    contourFilter.SetInputData(InputData)
+    contourFilter.SetValue(0, isoValue)
+
+    mapper = vtkPolyDataMapper()
+    mapper.SetInputConnection(contourFilter.GetOutputPort())
+    mapper.ScalarVisibilityOff()
+
+    actor = vtkActor()
+    actor.SetMapper(mapper)
+    actor.GetProperty().SetColor(color[0], color[1], color[2])
+    actor.GetProperty().SetOpacity(opacity)
+    return actor
+
+def task2(InputData, BoneValue):
     #create a contour using contourFilter
-    # <Insert Code >
-   
-    bonesActor = vtkActor()
-    # <Insert Code>
+    bonesActor = CreateContourActor(InputData, BoneValue, BONE_COLOR, BONE_OPACITY)
 
     #return the actor
     return bonesActor
     
-def task3(InputData):
+def task3(InputData, SkinValue):
     #create a contour using contourFilter
-    # <Insert Code>
-
-    skinnActor = vtkActor()
-    # <Insert Code>
+    skinActor = CreateContourActor(InputData, SkinValue, SKIN_COLOR, SKIN_OPACITY)
 
     #return the actor
-    return skinnActor
-
+    return skinActor
+
+def CreateIsoSurfaceVolume(InputData, SkinValue, BoneValue, window):
+    # render both iso-surfaces directly in one GPU ray caster instead of
+    # extracting polygonal meshes, a single volume so that the skin and the
+    # bones are composited correctly along each ray. Returns None if the
+    # window does not support GPU ray casting.
+    volumeProperty = vtkVolumeProperty()
+    mapper = vtkGPUVolumeRayCastMapper()
+    if not mapper.IsRenderSupported(window, volumeProperty):
+        return None
+    mapper.SetInputData(InputData)
+    mapper.SetBlendModeToIsoSurface()
+
+    colorFunction = vtkColorTransferFunction()
+    colorFunction.AddRGBPoint(SkinValue, SKIN_COLOR[0], SKIN_COLOR[1], SKIN_COLOR[2])
+    colorFunction.AddRGBPoint(BoneValue, BONE_COLOR[0], BONE_COLOR[1], BONE_COLOR[2])
+    opacityFunction = vtkPiecewiseFunction()
+    opacityFunction.AddPoint(SkinValue, SKIN_OPACITY)
+    opacityFunction.AddPoint(BoneValue, BONE_OPACITY)
+
+    volumeProperty.SetColor(colorFunction)
+    volumeProperty.SetScalarOpacity(opacityFunction)
+    volumeProperty.SetInterpolationTypeToLinear()
+    volumeProperty.ShadeOn()
+    volumeProperty.GetIsoSurfaceValues().SetValue(0, SkinValue)
+    volumeProperty.GetIsoSurfaceValues().SetValue(1, BoneValue)
+
+    volume = vtkVolume()
+    volume.SetMapper(mapper)
+    volume.SetProperty(volumeProperty)
+    return volume
 
 
 #Defining the Main Function 
 def main(argv):
     # define input variables
-    helpstr = """IntroVtkPython.py -i <InputFilename> [optional -b <ShowBoundingBox>]"""
+    helpstr = """IntroVtkPython.py -i <InputFilename> [optional -b <ShowBoundingBox>] [optional --skin=<IsoValue> --bone=<IsoValue>]"""
     # parse command line
     InputFilename = None
     ShowBBoxInStr = None
     ShowBBox = 0
+    SkinValue = None
+    BoneValue = None
     try:
-        opts, args = getopt.getopt(argv,"i:b:")
+        opts, args = getopt.getopt(argv,"i:b:",["skin=","bone="])
     except getopt.GetoptError:
         print (helpstr)
         sys.exit(2)
@@ -101,6 +162,10 @@ def main(argv):
             InputFilename = arg
         elif opt == "-b":
             ShowBBoxInStr = arg
+        elif opt == "--skin":
+            SkinValue = float(arg)
+        elif opt == "--bone":
+            BoneValue = float(arg)
 
     if InputFilename==None:
         print (helpstr)
@@ -114,11 +179,17 @@ def main(argv):
 
     # reading the file
     data = ReadInputFile(InputFilename)
-    #adding the actors to A List Of Actors
-    ListOfActors = []
-    BboxActor    = task1(data)
-    BonesActor   = task2(data)
-    SkinActor    = task3(data)
+    # default iso-values relative to the scalar range of the data
+    minValue, maxValue = data.GetScalarRange()
+    if SkinValue is None:
+        SkinValue = minValue + SKIN_FRACTION * (maxValue - minValue)
+    if BoneValue is None:
+        BoneValue = minValue + BONE_FRACTION * (maxValue - minValue)
+    print ("Iso-values skin={} bone={}".format(SkinValue, BoneValue))
+
+    window = vtkRenderWindow()
+    BboxActor = task1(data)
+    IsoVolume = CreateIsoSurfaceVolume(data, SkinValue, BoneValue, window)
     # disable the visibility of the BboxActor when
     # the boundingbox should not be shown
     # <Insert Code>
@@ -126,11 +197,15 @@ def main(argv):
     #adding the actors to A List Of Actors
     ListOfActors = []
     ListOfActors.append(BboxActor)
-    ListOfActors.append(BonesActor)
-    ListOfActors.append(SkinActor)
+    if IsoVolume is not None:
+        ListOfActors.append(IsoVolume)
+    else:
+        # no GPU ray casting, extract the iso-surfaces as polygons instead
+        ListOfActors.append(task2(data, BoneValue))
+        ListOfActors.append(task3(data, SkinValue))
    
     # create visualization and interaction 
-    CreateVisualizationFromListOfActors(ListOfActors)
+    CreateVisualizationFromListOfActors(ListOfActors, window)
     
 #Entry point
 if __name__ == "__main__":